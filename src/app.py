@@ -3,13 +3,14 @@ HawkAI - Sistema de Auditoria com Agentes de IA
 Interface estilo Terminal Retro (Fallout/Pip-Boy)
 """
 
+import time
 import streamlit as st
 from datetime import datetime
 from rag import get_rag
-from synth import synthesize, format_output
+from synth import synthesize, format_output, warmup_model
 from router import route
 from emails_analyzer import get_emails_analyzer
-from auditor import audit
+from auditor import audit, load_transactions, format_transactions, NO_EVIDENCE_ANSWER
 
 # Configuracao da pagina
 st.set_page_config(
@@ -240,14 +241,43 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def get_status_client():
+    """Cliente Ollama reutilizado entre reruns (mantem conexao aberta)"""
+    import httpx
+    import ollama
+    # Timeout curto de conexao: Ollama offline nao trava a renderizacao
+    return ollama.Client(timeout=httpx.Timeout(2.0, connect=0.5))
+
+
+# TTL do status do Ollama (offline expira rapido para detectar restart)
+OLLAMA_STATUS_TTL = 2.0
+OLLAMA_STATUS_TTL_OFFLINE = 0.5
+
+
+@st.cache_resource
+def get_status_cache() -> dict:
+    """Ultimo status do Ollama (compartilhado entre sessoes e reruns)"""
+    return {"checked_at": 0.0, "online": False}
+
+
 def check_ollama_status() -> bool:
     """Verifica se o Ollama esta rodando"""
+    cache = get_status_cache()
+    ttl = OLLAMA_STATUS_TTL if cache["online"] else OLLAMA_STATUS_TTL_OFFLINE
+    now = time.monotonic()
+    if now - cache["checked_at"] < ttl:
+        return cache["online"]
+    
     try:
-        import ollama
-        ollama.list()
-        return True
+        get_status_client().list()
+        online = True
     except Exception:
-        return False
+        online = False
+    
+    cache["checked_at"] = now
+    cache["online"] = online
+    return online
 
 
 # Estado
@@ -316,6 +346,15 @@ if not st.session_state.rag_ready:
                 unsafe_allow_html=True
             )
         
+        # Pre-carrega o modelo de chat (primeira pergunta nao paga o load)
+        for status in warmup_model():
+            status_lines.append(f">> {status}")
+            progress_html = "<br>".join(status_lines[-10:])
+            progress_container.markdown(
+                f'<div class="output-box step">{progress_html}</div>',
+                unsafe_allow_html=True
+            )
+        
         st.session_state.rag_ready = True
         st.rerun()
         
@@ -389,6 +428,9 @@ def run_generator(gen, logs: list[str], container):
         return e.value
     return None
 
+# Rotas cuja resposta passa pelo format_output (transacoes ja sai formatada do CSV)
+FORMATTED_ROUTES = {"compliance", "emails", "auditoria"}
+
 # Processa fora do form para permitir atualizacao em tempo real
 if submitted and prompt and not st.session_state.processing:
     st.session_state.processing = True
@@ -431,14 +473,8 @@ if submitted and prompt and not st.session_state.processing:
         
         elif route_name == "transacoes":
             # Analise de transacoes (direto do CSV)
-            from auditor import load_transactions, format_transactions
-            
-            # Carrega transacoes de todas as pessoas
-            all_transactions = []
-            for pessoa in pessoas:
-                all_transactions.extend(load_transactions(pessoa=pessoa, periodo=periodo))
-            if not pessoas:
-                all_transactions = load_transactions(periodo=periodo)
+            # Carrega transacoes de todas as pessoas numa unica leitura do CSV
+            all_transactions = load_transactions(periodo=periodo, pessoas=pessoas)
             
             if all_transactions:
                 answer = f"TRANSACOES ENCONTRADAS:\n\n{format_transactions(all_transactions, limit=30)}"
@@ -454,8 +490,10 @@ if submitted and prompt and not st.session_state.processing:
         else:
             answer = "Rota desconhecida."
         
-        # Passa todas as respostas pelo formatador para garantir consistencia
-        answer = run_generator(format_output(answer), logs, live_logs) or answer
+        # Passa as respostas da LLM pelo formatador para garantir consistencia.
+        # Transacoes e o veredito fixo sem evidencias ja saem prontos e pulam essa etapa.
+        if route_name in FORMATTED_ROUTES and answer != NO_EVIDENCE_ANSWER:
+            answer = run_generator(format_output(answer), logs, live_logs) or answer
         
         st.session_state.messages.append({"role": "answer", "content": answer})
     
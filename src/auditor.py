@@ -5,38 +5,121 @@ Usa compliance como base para regras
 
 import os
 import csv
+from functools import lru_cache
 from typing import Generator
-import ollama
 
 from rag import get_rag
+from synth import cached_chat
 from emails_analyzer import get_emails_analyzer
 
 LLM_MODEL = "llama3.2"
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 TRANSACTIONS_FILE = os.path.join(DATA_DIR, "transacoes_bancarias.csv")
 
+# Prompt do auditor (regras fixas + formato do veredito)
+AUDIT_PROMPT = """Voce e um auditor forense da Dunder Mifflin.
 
-def load_transactions(pessoa: str | None = None, periodo: str | None = None) -> list[dict]:
-    """Carrega transacoes do CSV, opcionalmente filtrando"""
+REGRAS DE COMPLIANCE:
+
+SECAO 3.3 - CONFLITO DE INTERESSES:
+- PROIBIDO usar dinheiro da empresa para projetos PESSOAIS
+- PROIBIDO financiar startups ou redes sociais do funcionario
+- Exemplo: WUPHF.com e projeto pessoal do Ryan, nao da empresa
+
+SECAO 1 - LIMITES DE APROVACAO:
+- Ate $50: funcionario tem autonomia
+- $50 a $500: precisa aprovacao do Gerente Regional  
+- Acima de $500: precisa Purchase Order assinado pelo CFO
+
+COMO ANALISAR:
+1. Leia os EMAILS para descobrir o PROPOSITO REAL das despesas
+2. Se o dinheiro foi para projeto PESSOAL = CONFLITO DE INTERESSES
+3. Se gastou acima de $500 sem PO do CFO = IRREGULARIDADE
+4. Use APENAS dados fornecidos, nao invente
+
+NAO use markdown. Texto simples.
+
+FORMATO:
+
+EMAILS SUSPEITOS
+[quem enviou, data, o que revela sobre fraude]
+
+TRANSACOES IRREGULARES
+[data, valor, descricao, qual regra viola]
+
+VIOLACAO PRINCIPAL
+[secao 3.3 ou secao 1, explicar]
+
+VEREDITO
+[FRAUDE DETECTADA ou SEM EVIDENCIAS]"""
+
+
+# Veredito quando nao ha emails nem transacoes para cruzar
+NO_EVIDENCE_ANSWER = """EMAILS SUSPEITOS
+Nenhum email encontrado.
+
+TRANSACOES IRREGULARES
+Nenhuma transacao encontrada.
+
+VIOLACAO PRINCIPAL
+Nenhuma.
+
+VEREDITO
+SEM EVIDENCIAS"""
+
+
+@lru_cache(maxsize=1)
+def _read_transactions(filepath: str, mtime_ns: int, size: int) -> tuple[tuple[str, dict], ...]:
+    """
+    Le o CSV uma vez. mtime/tamanho entram na chave para recarregar se mudar.
+    Cada linha vem acompanhada do funcionario em minusculas (usado no filtro).
+    """
+    with open(filepath, "r", encoding="utf-8") as f:
+        rows = tuple(csv.DictReader(f))
+    
+    # Converte valor uma unica vez na carga, nao a cada formatacao
+    for row in rows:
+        row["valor"] = float(row.get("valor") or 0)
+    return tuple((row.get("funcionario", "").lower(), row) for row in rows)
+
+
+def _all_transactions() -> tuple[tuple[str, dict], ...]:
+    """Todas as transacoes do CSV (memoizado; trate as linhas como somente leitura)"""
+    stat = os.stat(TRANSACTIONS_FILE)
+    return _read_transactions(TRANSACTIONS_FILE, stat.st_mtime_ns, stat.st_size)
+
+
+def load_transactions(
+    pessoa: str | None = None,
+    periodo: str | None = None,
+    pessoas: list[str] | None = None
+) -> list[dict]:
+    """
+    Carrega transacoes do CSV, opcionalmente filtrando.
+    Com `pessoas`, uma unica leitura traz as transacoes de qualquer um deles.
+    
+    As linhas devolvidas sao os proprios dicts do cache do CSV, compartilhados
+    por todas as sessoes: trate-as como somente leitura (copie antes de alterar).
+    """
     transactions = []
     
-    with open(TRANSACTIONS_FILE, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Filtra por pessoa se especificado
-            if pessoa:
-                pessoa_lower = pessoa.lower()
-                func_lower = row.get("funcionario", "").lower()
-                if pessoa_lower not in func_lower:
-                    continue
-            
-            # Filtra por periodo se especificado
-            if periodo:
-                data = row.get("data", "")
-                if periodo not in data:
-                    continue
-            
-            transactions.append(row)
+    nomes = [p.lower() for p in (pessoas or []) if p]
+    if pessoa:
+        nomes.append(pessoa.lower())
+    
+    for func_lower, row in _all_transactions():
+        # Filtra por pessoa(s) se especificado
+        if nomes:
+            if not any(nome in func_lower for nome in nomes):
+                continue
+        
+        # Filtra por periodo se especificado
+        if periodo:
+            data = row.get("data", "")
+            if periodo not in data:
+                continue
+        
+        transactions.append(row)
     
     return transactions
 
@@ -49,20 +132,20 @@ def format_transactions(transactions: list[dict], limit: int = 20) -> str:
     lines = []
     total = 0.0
     
-    for t in transactions[:limit]:
-        valor = float(t.get("valor", 0))
+    # Uma passada: soma todas as transacoes, formata apenas as primeiras
+    for i, t in enumerate(transactions):
+        valor = t.get("valor", 0.0)
         total += valor
-        # Formato sem separador de milhar para clareza
-        valor_str = f"{valor:.2f}".replace(",", "")
-        lines.append(
-            f"- {t['data']} | {t['funcionario']} | {t['descricao']} | ${valor_str} | {t['categoria']}"
-        )
+        if i < limit:
+            # Formato sem separador de milhar para clareza
+            lines.append(
+                f"- {t['data']} | {t['funcionario']} | {t['descricao']} | ${valor:.2f} | {t['categoria']}"
+            )
     
     if len(transactions) > limit:
         lines.append(f"... e mais {len(transactions) - limit} transacoes")
     
-    total_str = f"{total:.2f}".replace(",", "")
-    lines.append(f"\nTOTAL: ${total_str} em {len(transactions)} transacoes")
+    lines.append(f"\nTOTAL: ${total:.2f} em {len(transactions)} transacoes")
     
     return "\n".join(lines)
 
@@ -165,65 +248,32 @@ def audit(question: str, pessoa: str | None = None, periodo: str | None = None)
     
     # 4. Sintetiza veredito
     yield "-" * 40
+    
+    if not emails and not transactions:
+        yield "SEM EMAILS OU TRANSACOES PARA CRUZAR"
+        yield "AUDITORIA CONCLUIDA"
+        yield "=" * 40
+        return NO_EVIDENCE_ANSWER
+    
     yield "CRUZANDO DADOS..."
     yield "GERANDO VEREDITO..."
     
     context = "\n\n".join(context_parts)
     
-    system_prompt = """Voce e um auditor forense da Dunder Mifflin.
-
-REGRAS DE COMPLIANCE:
-
-SECAO 3.3 - CONFLITO DE INTERESSES:
-- PROIBIDO usar dinheiro da empresa para projetos PESSOAIS
-- PROIBIDO financiar startups ou redes sociais do funcionario
-- Exemplo: WUPHF.com e projeto pessoal do Ryan, nao da empresa
-
-SECAO 1 - LIMITES DE APROVACAO:
-- Ate $50: funcionario tem autonomia
-- $50 a $500: precisa aprovacao do Gerente Regional  
-- Acima de $500: precisa Purchase Order assinado pelo CFO
-
-COMO ANALISAR:
-1. Leia os EMAILS para descobrir o PROPOSITO REAL das despesas
-2. Se o dinheiro foi para projeto PESSOAL = CONFLITO DE INTERESSES
-3. Se gastou acima de $500 sem PO do CFO = IRREGULARIDADE
-4. Use APENAS dados fornecidos, nao invente
-
-NAO use markdown. Texto simples.
-
-FORMATO:
-
-EMAILS SUSPEITOS
-[quem enviou, data, o que revela sobre fraude]
-
-TRANSACOES IRREGULARES
-[data, valor, descricao, qual regra viola]
-
-VIOLACAO PRINCIPAL
-[secao 3.3 ou secao 1, explicar]
-
-VEREDITO
-[FRAUDE DETECTADA ou SEM EVIDENCIAS]"""
-
-    pessoa_context = f" sobre {pessoa}" if pessoa else ""
-    user_prompt = f"""PERGUNTA DO INVESTIGADOR: {question}
-
-DADOS COLETADOS{pessoa_context}:
+    # Partes estaveis (regras) primeiro; pessoa e pergunta so no fim:
+    # chamadas seguidas compartilham o prefixo e o Ollama reaproveita o KV cache
+    pessoa_context = f"INVESTIGADO: {pessoa}\n" if pessoa else ""
+    user_prompt = f"""DADOS COLETADOS:
 
 {context}
 
+{pessoa_context}PERGUNTA DO INVESTIGADOR: {question}
+
 ANALISE:"""
 
-    response = ollama.chat(
-        model=LLM_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-    )
-    
-    answer = response["message"]["content"]
+    answer, cached = cached_chat(AUDIT_PROMPT, user_prompt, model=LLM_MODEL)
+    if cached:
+        yield "VEREDITO EM CACHE"
     
     yield "AUDITORIA CONCLUIDA"
     yield "=" * 40
@@ -6,57 +6,63 @@ Suporta GPU NVIDIA quando disponivel (faiss-gpu)
 
 import os
 import json
-import hashlib
-import re
-from typing import Generator, Any
+from typing import Generator, Any, Iterable
 
 import faiss  # type: ignore
 import numpy as np
-import ollama
+
+from synth import cached_chat
+from vector_utils import (
+    HAS_GPU,
+    NUM_GPUS,
+    index_to_gpu,
+    index_to_cpu,
+    cache_signature,
+    cache_is_valid,
+    get_embedding,
+    get_embeddings,
+)
 
 # Configuracoes
-EMBEDDING_MODEL = "mxbai-embed-large"
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 EMAILS_FILE = os.path.join(DATA_DIR, "emails.txt")
 CACHE_DIR = os.path.join(DATA_DIR, ".cache")
 INDEX_FILE = os.path.join(CACHE_DIR, "emails.index")
 CHUNKS_FILE = os.path.join(CACHE_DIR, "emails.json")
 HASH_FILE = os.path.join(CACHE_DIR, "emails.hash")
+LLM_MODEL = "llama3.2"
 
+# Emails por chamada de embedding na indexacao
+EMBED_BATCH_SIZE = 20
 
-# Detecta GPU
-def _detect_gpu() -> tuple[bool, int]:
-    """Detecta se GPU esta disponivel para FAISS"""
-    try:
-        num_gpus = faiss.get_num_gpus()  # type: ignore
-        return num_gpus > 0, num_gpus
-    except AttributeError:
-        # faiss-cpu nao tem get_num_gpus
-        return False, 0
+# Limites do contexto enviado a LLM na analise
+MAX_EMAILS_CONTEXT = 10
+MAX_MESSAGE_CHARS = 400
 
+# Linha que separa os emails no dump
+EMAIL_SEPARATOR = "-" * 79
 
-HAS_GPU, NUM_GPUS = _detect_gpu()
+# Prompt para analise de emails
+ANALYZE_PROMPT = """Voce e um analista de emails corporativos.
+Analise os emails fornecidos e responda a pergunta do usuario.
+Seja especifico: cite remetentes, datas e trechos relevantes.
+NAO use markdown. Texto simples apenas."""
 
 
-def _index_to_gpu(index: Any) -> Any:
-    """Move index para GPU se disponivel"""
-    if HAS_GPU:
-        try:
-            res = faiss.StandardGpuResources()  # type: ignore
-            return faiss.index_cpu_to_gpu(res, 0, index)  # type: ignore
-        except Exception:
-            return index
-    return index
+def _empty_email() -> dict:
+    """Email com todos os campos vazios"""
+    return {
+        "de": "",
+        "para": "",
+        "data": "",
+        "assunto": "",
+        "mensagem": ""
+    }
 
 
-def _index_to_cpu(index: Any) -> Any:
-    """Move index para CPU (para salvar em disco)"""
-    if HAS_GPU:
-        try:
-            return faiss.index_gpu_to_cpu(index)  # type: ignore
-        except Exception:
-            return index
-    return index
+def _header_name(value: str) -> str:
+    """Nome de um cabecalho De/Para, sem o endereco entre < >"""
+    return value.partition("<")[0].strip()
 
 
 class EmailsAnalyzer:
@@ -64,33 +70,29 @@ class EmailsAnalyzer:
     
     def __init__(self):
         self.emails: list[dict] = []  # Lista de emails parseados
+        self._person_texts: list[str] = []  # de/para/mensagem em minusculas, por email
         self.index: Any = None
         self.dimension: int = 1024
         self._initialized = False
         self._using_gpu = False
     
-    def _get_file_hash(self, filepath: str) -> str:
-        """Calcula hash MD5 do arquivo"""
-        with open(filepath, "rb") as f:
-            return hashlib.md5(f.read()).hexdigest()
+    def _build_person_texts(self):
+        """Pre-calcula o texto em minusculas usado no filtro por pessoa"""
+        self._person_texts = [
+            f"{e['de']}\n{e['para']}\n{e['mensagem']}".lower()
+            for e in self.emails
+        ]
     
     def _cache_exists(self) -> bool:
         """Verifica se o cache existe e eh valido"""
-        if not all(os.path.exists(f) for f in [INDEX_FILE, CHUNKS_FILE, HASH_FILE]):
-            return False
-        
-        with open(HASH_FILE, "r") as f:
-            cached_hash = f.read().strip()
-        
-        current_hash = self._get_file_hash(EMAILS_FILE)
-        return cached_hash == current_hash
+        return cache_is_valid((INDEX_FILE, CHUNKS_FILE, HASH_FILE), HASH_FILE, EMAILS_FILE)
     
     def _load_cache(self) -> bool:
         """Carrega index e emails do cache"""
         try:
             cpu_index = faiss.read_index(INDEX_FILE)
             # Tenta mover para GPU
-            self.index = _index_to_gpu(cpu_index)
+            self.index = index_to_gpu(cpu_index)
             self._using_gpu = HAS_GPU
             with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
                 self.emails = json.load(f)
@@ -102,77 +104,67 @@ class EmailsAnalyzer:
         """Salva index e emails no cache"""
         os.makedirs(CACHE_DIR, exist_ok=True)
         # Precisa converter para CPU antes de salvar
-        cpu_index = _index_to_cpu(self.index)
+        cpu_index = index_to_cpu(self.index)
         faiss.write_index(cpu_index, INDEX_FILE)
         with open(CHUNKS_FILE, "w", encoding="utf-8") as f:
             json.dump(self.emails, f, ensure_ascii=False)
         with open(HASH_FILE, "w") as f:
-            f.write(self._get_file_hash(EMAILS_FILE))
-    
-    def _get_embedding(self, text: str, max_chars: int = 1500) -> np.ndarray:
-        """Gera embedding via Ollama. Trunca texto para evitar exceder contexto."""
-        # mxbai-embed-large tem limite de ~512 tokens (~1500-2000 chars)
-        if len(text) > max_chars:
-            text = text[:max_chars]
-        response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=text)
-        return np.array(response["embedding"], dtype=np.float32)
+            f.write(cache_signature(EMAILS_FILE))
     
-    def _parse_emails(self, content: str) -> list[dict]:
-        """Parseia arquivo de emails em lista estruturada"""
+    def _parse_emails(self, lines: Iterable[str]) -> list[dict]:
+        """
+        Parseia o dump de emails em lista estruturada.
+        Le linha a linha (aceita o proprio arquivo aberto): nenhum bloco
+        de texto intermediario e montado.
+        """
         emails = []
+        email = _empty_email()
+        in_message = False
+        message_lines: list[str] = []
         
-        # Divide por separador
-        raw_emails = content.split("-" * 79)
-        
-        for raw in raw_emails:
-            raw = raw.strip()
-            if not raw or "De:" not in raw:
-                continue
-            
-            email = {
-                "de": "",
-                "para": "",
-                "data": "",
-                "assunto": "",
-                "mensagem": "",
-                "texto_completo": raw
-            }
-            
-            lines = raw.split("\n")
-            in_message = False
-            message_lines = []
+        for line in lines:
+            line = line.strip()
             
-            for line in lines:
-                line = line.strip()
-                
-                if line.startswith("De:"):
-                    # Extrai nome do email
-                    match = re.search(r"De:\s*([^<]+)", line)
-                    if match:
-                        email["de"] = match.group(1).strip()
-                elif line.startswith("Para:"):
-                    match = re.search(r"Para:\s*([^<]+)", line)
-                    if match:
-                        email["para"] = match.group(1).strip()
-                elif line.startswith("Data:"):
-                    email["data"] = line.replace("Data:", "").strip()
-                elif line.startswith("Assunto:"):
-                    email["assunto"] = line.replace("Assunto:", "").strip()
-                elif line.startswith("Mensagem:"):
-                    in_message = True
-                elif in_message and line:
-                    message_lines.append(line)
-            
-            email["mensagem"] = " ".join(message_lines)
+            # Separador fecha o email atual
+            if line.startswith(EMAIL_SEPARATOR):
+                email["mensagem"] = " ".join(message_lines)
+                if email["de"] and email["mensagem"]:
+                    emails.append(email)
+                email = _empty_email()
+                in_message = False
+                message_lines = []
+                continue
             
-            if email["de"] and email["mensagem"]:
-                emails.append(email)
+            # Cabecalhos sao prefixos fixos: basta fatiar, sem regex
+            if line.startswith("De:"):
+                # Extrai nome do email (antes do "<endereco>")
+                email["de"] = _header_name(line[3:])
+            elif line.startswith("Para:"):
+                email["para"] = _header_name(line[5:])
+            elif line.startswith("Data:"):
+                email["data"] = line[5:].strip()
+            elif line.startswith("Assunto:"):
+                email["assunto"] = line[8:].strip()
+            elif line.startswith("Mensagem:"):
+                in_message = True
+            elif in_message and line:
+                message_lines.append(line)
+        
+        # Ultimo email (arquivo pode nao terminar com separador)
+        email["mensagem"] = " ".join(message_lines)
+        if email["de"] and email["mensagem"]:
+            emails.append(email)
         
         return emails
     
     def initialize(self) -> Generator[str, None, None]:
         """Inicializa o analisador de emails"""
         
+        # Singleton compartilhado entre sessoes: nao recarrega do disco
+        if self._initialized:
+            yield f"EMAILS JA CARREGADOS: {len(self.emails)} EMAILS"
+            return
+        
         # Info sobre GPU
         if HAS_GPU:
             yield f"GPU DETECTADA: {NUM_GPUS} DISPOSITIVO(S)"
@@ -186,42 +178,43 @@ class EmailsAnalyzer:
             if self._load_cache():
                 gpu_status = " [GPU]" if self._using_gpu else " [CPU]"
                 yield f"CARREGADO: {len(self.emails)} EMAILS{gpu_status}"
+                self._build_person_texts()
                 self._initialized = True
                 return
         
         yield "INDEXANDO EMAILS..."
         
         with open(EMAILS_FILE, "r", encoding="utf-8") as f:
-            content = f.read()
-        
-        self.emails = self._parse_emails(content)
+            self.emails = self._parse_emails(f)
         yield f"{len(self.emails)} EMAILS PARSEADOS"
         
         yield "GERANDO EMBEDDINGS DE EMAILS..."
-        embeddings = []
-        for i, email in enumerate(self.emails):
-            # Texto para embedding: combina campos relevantes
-            text = f"De: {email['de']} Para: {email['para']} Assunto: {email['assunto']} {email['mensagem']}"
-            emb = self._get_embedding(text)
-            embeddings.append(emb)
-            if i == 0:
-                self.dimension = len(emb)
-            if (i + 1) % 20 == 0:
-                yield f"EMBEDDING {i+1}/{len(self.emails)}"
+        # Texto para embedding: combina campos relevantes
+        texts = [
+            f"De: {email['de']} Para: {email['para']} Assunto: {email['assunto']} {email['mensagem']}"
+            for email in self.emails
+        ]
         
-        yield f"EMBEDDING {len(self.emails)}/{len(self.emails)}"
+        # Embeddings em lotes: uma chamada ao Ollama por lote
+        embeddings = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            batch = texts[start:start + EMBED_BATCH_SIZE]
+            embeddings.append(get_embeddings(batch))
+            yield f"EMBEDDING {start + len(batch)}/{len(texts)}"
         
         embeddings_matrix = np.vstack(embeddings)
+        self.dimension = embeddings_matrix.shape[1]
         cpu_index = faiss.IndexFlatL2(self.dimension)
         cpu_index.add(embeddings_matrix)
         
         # Tenta mover para GPU
-        self.index = _index_to_gpu(cpu_index)
+        self.index = index_to_gpu(cpu_index)
         self._using_gpu = HAS_GPU
         
         yield "SALVANDO CACHE DE EMAILS..."
         self._save_cache()
         
+        self._build_person_texts()
         self._initialized = True
         gpu_status = " [GPU]" if self._using_gpu else " [CPU]"
         yield f"EMAILS INDEXADOS{gpu_status}"
@@ -239,12 +232,10 @@ class EmailsAnalyzer:
         if pessoa:
             yield f"FILTRANDO POR: {pessoa}"
             pessoa_lower = pessoa.lower()
-            filtered_indices = []
-            for i, email in enumerate(self.emails):
-                if (pessoa_lower in email["de"].lower() or 
-                    pessoa_lower in email["para"].lower() or
-                    pessoa_lower in email["mensagem"].lower()):
-                    filtered_indices.append(i)
+            filtered_indices = [
+                i for i, text in enumerate(self._person_texts)
+                if pessoa_lower in text
+            ]
             
             if not filtered_indices:
                 yield f"NENHUM EMAIL ENCONTRADO PARA {pessoa}"
@@ -256,14 +247,15 @@ class EmailsAnalyzer:
             results = [self.emails[i] for i in filtered_indices[:k]]
         else:
             # Busca semantica
-            query_emb = self._get_embedding(query)
+            query_emb = get_embedding(query)
             query_emb = query_emb.reshape(1, -1)
             
-            distances, indices = self.index.search(query_emb, k)
+            # FAISS completa com -1 quando k > total de vetores
+            distances, indices = self.index.search(query_emb, min(k, self.index.ntotal))
             
             results = []
             for idx in indices[0]:
-                if idx < len(self.emails):
+                if 0 <= idx < len(self.emails):
                     results.append(self.emails[idx])
         
         yield f"{len(results)} EMAILS ENCONTRADOS"
@@ -282,6 +274,7 @@ class EmailsAnalyzer:
         # Busca emails de todas as pessoas mencionadas
         emails = []
         if pessoas:
+            seen_ids: set[int] = set()
             for pessoa in pessoas:
                 search_gen = self.search(query, pessoa=pessoa, k=10)
                 try:
@@ -290,9 +283,11 @@ class EmailsAnalyzer:
                         yield status
                 except StopIteration as e:
                     found = e.value or []
-                    # Evita duplicatas
+                    # Evita duplicatas: search devolve os proprios dicts de
+                    # self.emails, entao a identidade basta (O(1) por email)
                     for email in found:
-                        if email not in emails:
+                        if id(email) not in seen_ids:
+                            seen_ids.add(id(email))
                             emails.append(email)
         else:
             # Busca semantica sem filtro de pessoa
@@ -310,23 +305,30 @@ class EmailsAnalyzer:
         
         yield "ANALISANDO CONTEUDO..."
         
-        # Formata emails para contexto
+        # Formata emails para contexto, pulando repetidos e cortando mensagens longas
         emails_text = []
-        for e in emails[:10]:
+        seen_signatures = set()
+        for e in emails:
+            if len(seen_signatures) == MAX_EMAILS_CONTEXT:
+                break
+            signature = (e["assunto"], e["mensagem"][:200])
+            if signature in seen_signatures:
+                continue
+            seen_signatures.add(signature)
+            
+            mensagem = e["mensagem"]
+            if len(mensagem) > MAX_MESSAGE_CHARS:
+                mensagem = mensagem[:MAX_MESSAGE_CHARS] + "..."
+            
             emails_text.append(f"De: {e['de']}")
             emails_text.append(f"Para: {e['para']}")
             emails_text.append(f"Data: {e['data']}")
             emails_text.append(f"Assunto: {e['assunto']}")
-            emails_text.append(f"Mensagem: {e['mensagem']}")
+            emails_text.append(f"Mensagem: {mensagem}")
             emails_text.append("---")
         
         context = "\n".join(emails_text)
         
-        system_prompt = """Voce e um analista de emails corporativos.
-Analise os emails fornecidos e responda a pergunta do usuario.
-Seja especifico: cite remetentes, datas e trechos relevantes.
-NAO use markdown. Texto simples apenas."""
-
         user_prompt = f"""EMAILS:
 {context}
 
@@ -336,15 +338,9 @@ ANALISE:"""
 
         yield "CONSULTANDO LLM..."
         
-        response = ollama.chat(
-            model="llama3.2",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
-        
-        answer = response["message"]["content"]
+        answer, cached = cached_chat(ANALYZE_PROMPT, user_prompt, model=LLM_MODEL)
+        if cached:
+            yield "ANALISE EM CACHE"
         
         yield "ANALISE CONCLUIDA"
         return answer
@@ -6,15 +6,22 @@ Suporta GPU NVIDIA quando disponivel (faiss-gpu)
 
 import os
 import json
-import hashlib
 from typing import Generator, Any
 
 import faiss  # type: ignore
-import numpy as np
-import ollama
+
+from vector_utils import (
+    HAS_GPU,
+    NUM_GPUS,
+    index_to_gpu,
+    index_to_cpu,
+    cache_signature,
+    cache_is_valid,
+    get_embedding,
+    get_embeddings,
+)
 
 # Configuracoes
-EMBEDDING_MODEL = "mxbai-embed-large"
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 POLICY_FILE = os.path.join(DATA_DIR, "politica_compliance.txt")
 CACHE_DIR = os.path.join(DATA_DIR, ".cache")
@@ -22,40 +29,8 @@ INDEX_FILE = os.path.join(CACHE_DIR, "faiss.index")
 CHUNKS_FILE = os.path.join(CACHE_DIR, "chunks.json")
 HASH_FILE = os.path.join(CACHE_DIR, "policy.hash")
 
-
-# Detecta GPU
-def _detect_gpu() -> tuple[bool, int]:
-    """Detecta se GPU esta disponivel para FAISS"""
-    try:
-        num_gpus = faiss.get_num_gpus()  # type: ignore
-        return num_gpus > 0, num_gpus
-    except AttributeError:
-        # faiss-cpu nao tem get_num_gpus
-        return False, 0
-
-
-HAS_GPU, NUM_GPUS = _detect_gpu()
-
-
-def _index_to_gpu(index: Any) -> Any:
-    """Move index para GPU se disponivel"""
-    if HAS_GPU:
-        try:
-            res = faiss.StandardGpuResources()  # type: ignore
-            return faiss.index_cpu_to_gpu(res, 0, index)  # type: ignore
-        except Exception:
-            return index
-    return index
-
-
-def _index_to_cpu(index: Any) -> Any:
-    """Move index para CPU (para salvar em disco)"""
-    if HAS_GPU:
-        try:
-            return faiss.index_gpu_to_cpu(index)  # type: ignore
-        except Exception:
-            return index
-    return index
+# Linhas de "=" separam as secoes da politica (prefixo basta para reconhecer)
+SECTION_SEPARATOR = "=" * 10
 
 
 class ComplianceRAG:
@@ -68,28 +43,16 @@ class ComplianceRAG:
         self._initialized = False
         self._using_gpu = False
     
-    def _get_file_hash(self, filepath: str) -> str:
-        """Calcula hash MD5 do arquivo"""
-        with open(filepath, "rb") as f:
-            return hashlib.md5(f.read()).hexdigest()
-    
     def _cache_exists(self) -> bool:
         """Verifica se o cache existe e eh valido"""
-        if not all(os.path.exists(f) for f in [INDEX_FILE, CHUNKS_FILE, HASH_FILE]):
-            return False
-        
-        with open(HASH_FILE, "r") as f:
-            cached_hash = f.read().strip()
-        
-        current_hash = self._get_file_hash(POLICY_FILE)
-        return cached_hash == current_hash
+        return cache_is_valid((INDEX_FILE, CHUNKS_FILE, HASH_FILE), HASH_FILE, POLICY_FILE)
     
     def _load_cache(self) -> bool:
         """Carrega index e chunks do cache"""
         try:
             cpu_index = faiss.read_index(INDEX_FILE)
             # Tenta mover para GPU
-            self.index = _index_to_gpu(cpu_index)
+            self.index = index_to_gpu(cpu_index)
             self._using_gpu = HAS_GPU
             with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
                 self.chunks = json.load(f)
@@ -101,20 +64,12 @@ class ComplianceRAG:
         """Salva index e chunks no cache"""
         os.makedirs(CACHE_DIR, exist_ok=True)
         # Precisa converter para CPU antes de salvar
-        cpu_index = _index_to_cpu(self.index)
+        cpu_index = index_to_cpu(self.index)
         faiss.write_index(cpu_index, INDEX_FILE)
         with open(CHUNKS_FILE, "w", encoding="utf-8") as f:
             json.dump(self.chunks, f, ensure_ascii=False)
         with open(HASH_FILE, "w") as f:
-            f.write(self._get_file_hash(POLICY_FILE))
-    
-    def _get_embedding(self, text: str, max_chars: int = 1500) -> np.ndarray:
-        """Gera embedding via Ollama. Trunca texto para evitar exceder contexto."""
-        # mxbai-embed-large tem limite de ~512 tokens (~1500-2000 chars)
-        if len(text) > max_chars:
-            text = text[:max_chars]
-        response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=text)
-        return np.array(response["embedding"], dtype=np.float32)
+            f.write(cache_signature(POLICY_FILE))
     
     def _chunk_policy(self, text: str) -> list[str]:
         """Divide a politica em chunks por secao"""
@@ -122,7 +77,7 @@ class ComplianceRAG:
         current_chunk = []
         
         for line in text.split("\n"):
-            if line.startswith("=" * 10):
+            if line.startswith(SECTION_SEPARATOR):
                 if current_chunk:
                     chunk_text = "\n".join(current_chunk).strip()
                     if chunk_text and len(chunk_text) > 50:
@@ -141,6 +96,11 @@ class ComplianceRAG:
     def initialize(self) -> Generator[str, None, None]:
         """Inicializa o RAG"""
         
+        # Singleton compartilhado entre sessoes: nao recarrega do disco
+        if self._initialized:
+            yield f"RAG JA CARREGADO: {len(self.chunks)} SECOES"
+            return
+        
         # Info sobre GPU
         if HAS_GPU:
             yield f"GPU DETECTADA: {NUM_GPUS} DISPOSITIVO(S)"
@@ -165,20 +125,16 @@ class ComplianceRAG:
         self.chunks = self._chunk_policy(policy_text)
         yield f"{len(self.chunks)} SECOES IDENTIFICADAS"
         
-        embeddings = []
-        for i, chunk in enumerate(self.chunks):
-            emb = self._get_embedding(chunk)
-            embeddings.append(emb)
-            if i == 0:
-                self.dimension = len(emb)
-            yield f"EMBEDDING {i+1}/{len(self.chunks)}"
+        # Uma unica chamada ao Ollama para todas as secoes
+        embeddings_matrix = get_embeddings(self.chunks)
+        self.dimension = embeddings_matrix.shape[1]
+        yield f"EMBEDDING {len(self.chunks)}/{len(self.chunks)}"
         
-        embeddings_matrix = np.vstack(embeddings)
         cpu_index = faiss.IndexFlatL2(self.dimension)
         cpu_index.add(embeddings_matrix)
         
         # Tenta mover para GPU
-        self.index = _index_to_gpu(cpu_index)
+        self.index = index_to_gpu(cpu_index)
         self._using_gpu = HAS_GPU
         
         yield "SALVANDO CACHE..."
@@ -197,14 +153,15 @@ class ComplianceRAG:
         
         yield "BUSCANDO CONTEXTO..."
         
-        query_emb = self._get_embedding(query)
+        query_emb = get_embedding(query)
         query_emb = query_emb.reshape(1, -1)
         
-        distances, indices = self.index.search(query_emb, k)
+        # FAISS completa com -1 quando k > total de vetores
+        distances, indices = self.index.search(query_emb, min(k, self.index.ntotal))
         
         results = []
         for dist, idx in zip(distances[0], indices[0]):
-            if idx < len(self.chunks):
+            if 0 <= idx < len(self.chunks):
                 results.append(self.chunks[idx])
         
         yield f"{len(results)} SECOES ENCONTRADAS"
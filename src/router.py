@@ -1,14 +1,66 @@
 """
 Router Module - Decide qual fluxo executar e extrai entidades
 Usa LLM com temperatura 0 para consistencia
+Perguntas obvias de compliance sao classificadas por palavras-chave (sem LLM)
 """
 
 import json
+import re
+import threading
+from collections import OrderedDict
 from typing import Generator
 import ollama
 
+from synth import KEEP_ALIVE
+
 LLM_MODEL = "llama3.2"
 
+# Rotas em ordem de prioridade para o fallback por texto
+ROUTES = ("auditoria", "emails", "transacoes", "compliance")
+VALID_ROUTES = frozenset(ROUTES)
+
+# Resultado padrao quando a LLM nao devolve JSON utilizavel
+DEFAULT_RESULT = {"rota": "compliance", "pessoas": [], "periodo": None}
+
+# Atalho sem LLM: perguntas sobre regras que nao mencionam ninguem.
+# Toda palavra da pergunta precisa estar no vocabulario abaixo; qualquer
+# outra (ex: um nome, mesmo digitado em minusculas) vai para a LLM.
+# Substantivos de dados (gastos, compras, valores) e numeros soltos (anos,
+# datas) ficam de fora: indicam consulta a transacoes/periodo, nao regra.
+QUESTION_STARTERS = frozenset({
+    "qual", "quais", "quanto", "quantos", "quantas", "como", "quando", "onde",
+    "o", "a", "os", "as", "e", "é", "existe", "existem", "posso", "pode",
+    "podemos", "preciso", "precisa", "ha", "há",
+})
+POLICY_WORDS = frozenset({
+    "limite", "limites", "politica", "política", "politicas", "políticas",
+    "regra", "regras", "norma", "normas", "permitido", "permitida",
+    "permitidos", "permitidas", "proibido", "proibida", "proibidos",
+    "proibidas", "aprovacao", "aprovação", "aprovar", "aprovado", "aprovada",
+    "reembolso", "reembolsos", "reembolsar", "alcada", "alçada",
+})
+FILLER_WORDS = frozenset({
+    "de", "do", "da", "dos", "das", "em", "no", "na", "nos", "nas", "para",
+    "por", "pelo", "pela", "com", "sem", "um", "uma", "que", "se", "ao", "à",
+    "ou", "mais", "menos", "acima", "abaixo", "ate", "até", "sobre", "entre",
+    "sao", "são", "ser", "tem", "ter", "eu", "meu", "minha", "qualquer",
+    "empresa",
+    "funcionario", "funcionário", "funcionarios", "funcionários", "gerente",
+    "regional", "cfo", "purchase", "order", "po", "conflito", "interesse",
+    "interesses", "viagem", "viagens", "refeicao", "refeição", "refeicoes",
+    "refeições", "presente", "presentes", "brinde", "brindes", "compliance",
+})
+_FAST_ROUTE_VOCABULARY = QUESTION_STARTERS | POLICY_WORDS | FILLER_WORDS
+_WORD_RE = re.compile(r"\$?\w+")
+
+# Decoder reutilizado para extrair o primeiro objeto JSON da resposta
+_JSON_DECODER = json.JSONDecoder()
+
+# Cache de classificacoes (temperatura 0: mesma pergunta -> mesma rota)
+ROUTE_CACHE_SIZE = 256
+_route_cache: OrderedDict[str, dict] = OrderedDict()
+_route_cache_lock = threading.Lock()  # compartilhado pelas sessoes do Streamlit
+
 SYSTEM_PROMPT = """Classifique a pergunta e extraia pessoas mencionadas.
 
 CATEGORIAS:
@@ -30,13 +82,43 @@ EXEMPLOS:
 Responda APENAS JSON:"""
 
 
-def route(question: str) -> Generator[str, None, dict]:
+def _default_result() -> dict:
+    """Copia do resultado padrao (lista de pessoas nova a cada chamada)"""
+    return {**DEFAULT_RESULT, "pessoas": []}
+
+
+def _cache_key(question: str) -> str:
+    """Normaliza a pergunta (caixa e espacos) para uso como chave de cache"""
+    return " ".join(question.lower().split())
+
+
+def _is_amount(word: str) -> bool:
+    """Valor em dolares como "$500" (numero solto nao conta)"""
+    return word.startswith("$") and word[1:].isdigit()
+
+
+def _fast_route(question: str) -> dict | None:
     """
-    Determina qual rota seguir e extrai entidades.
-    Yields status, returns dict com rota e entidades.
+    Classifica sem LLM perguntas obvias de compliance.
+    Retorna None quando a pergunta pode mencionar pessoa ou outra rota.
     """
+    words = [word.lower() for word in _WORD_RE.findall(question)]
+    if not words or words[0] not in QUESTION_STARTERS:
+        return None
     
-    yield "ANALISANDO PERGUNTA..."
+    # Palavra fora do vocabulario pode ser nome de pessoa e numero sem "$"
+    # pode ser ano/data (periodo): deixa para a LLM
+    if not all(word in _FAST_ROUTE_VOCABULARY or _is_amount(word) for word in words):
+        return None
+    
+    if not any(word in POLICY_WORDS for word in words):
+        return None
+    
+    return _default_result()
+
+
+def _classify(question: str) -> dict:
+    """Classifica a pergunta com a LLM e normaliza o resultado"""
     
     response = ollama.chat(
         model=LLM_MODEL,
@@ -44,33 +126,34 @@ def route(question: str) -> Generator[str, None, dict]:
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": question}
         ],
+        format="json",
         options={
             "temperature": 0,
             "num_predict": 100,
-        }
+        },
+        keep_alive=KEEP_ALIVE
     )
     
     answer = response["message"]["content"].strip()
     
     # Tenta parsear JSON
     try:
-        # Limpa resposta se tiver texto extra
+        # Ignora texto extra: decodifica so o primeiro objeto balanceado
         if "{" in answer:
-            json_str = answer[answer.find("{"):answer.rfind("}")+1]
-            result = json.loads(json_str)
+            result, _ = _JSON_DECODER.raw_decode(answer, answer.find("{"))
         else:
-            result = {"rota": "compliance", "pessoas": [], "periodo": None}
+            result = _default_result()
     except json.JSONDecodeError:
         # Fallback: tenta extrair rota do texto
-        result = {"rota": "compliance", "pessoas": [], "periodo": None}
-        for rota in ["auditoria", "emails", "transacoes", "compliance"]:
-            if rota in answer.lower():
+        result = _default_result()
+        answer_lower = answer.lower()
+        for rota in ROUTES:
+            if rota in answer_lower:
                 result["rota"] = rota
                 break
     
     # Normaliza rota
-    valid_routes = ["compliance", "emails", "transacoes", "auditoria"]
-    if result.get("rota") not in valid_routes:
+    if result.get("rota") not in VALID_ROUTES:
         result["rota"] = "compliance"
     
     # Normaliza pessoas (garante que seja lista)
@@ -81,6 +164,42 @@ def route(question: str) -> Generator[str, None, dict]:
         pessoas = [pessoas]
     result["pessoas"] = pessoas
     
+    return result
+
+
+def route(question: str) -> Generator[str, None, dict]:
+    """
+    Determina qual rota seguir e extrai entidades.
+    Yields status, returns dict com rota e entidades.
+    """
+    
+    yield "ANALISANDO PERGUNTA..."
+    
+    # Atalho antes do cache: resultado barato, nao ocupa a chave normalizada
+    cached = _fast_route(question)
+    if cached is not None:
+        yield "ROTA POR PALAVRAS-CHAVE"
+    else:
+        key = _cache_key(question)
+        with _route_cache_lock:
+            cached = _route_cache.get(key)
+            if cached is not None:
+                _route_cache.move_to_end(key)
+        
+        if cached is not None:
+            yield "ROTA EM CACHE"
+        else:
+            # LLM fora do lock: nao bloqueia as outras sessoes
+            cached = _classify(question)
+            with _route_cache_lock:
+                _route_cache[key] = cached
+                if len(_route_cache) > ROUTE_CACHE_SIZE:
+                    _route_cache.popitem(last=False)
+    
+    # Copia para o chamador nao alterar a entrada do cache
+    result = {**cached, "pessoas": list(cached["pessoas"])}
+    pessoas = result["pessoas"]
+    
     # Log
     rota = result["rota"].upper()
     periodo = result.get("periodo")
@@ -3,11 +3,23 @@ Synthesizer Module - Usa LLM para sintetizar e formatar respostas
 Centraliza toda geracao de texto para garantir consistencia
 """
 
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Generator
 import ollama
 
 LLM_MODEL = "llama3.2"
 
+# Tempo que o Ollama mantem cada modelo (LLM e embeddings) carregado entre
+# perguntas (padrao do servidor: 5m). Importado por router e vector_utils.
+KEEP_ALIVE = "30m"
+
+# Cache de respostas por prompt canonico (mesmo prompt -> mesma resposta)
+RESPONSE_CACHE_SIZE = 128
+_response_cache: OrderedDict[str, str] = OrderedDict()
+_response_cache_lock = threading.Lock()  # compartilhado pelas sessoes do Streamlit
+
 # Prompt para compliance (RAG)
 COMPLIANCE_PROMPT = """Voce e um assistente de compliance da Dunder Mifflin.
 Responda APENAS com base no contexto fornecido da politica de compliance.
@@ -31,6 +43,61 @@ REGRAS:
 Se o texto ja estiver bem formatado, retorne-o com minimas alteracoes."""
 
 
+def _prompt_key(model: str, system_prompt: str, user_prompt: str) -> str:
+    """Chave SHA-256 do prompt, ignorando espacos no fim das linhas"""
+    canonical = "\x00".join(
+        "\n".join(line.rstrip() for line in part.strip().splitlines())
+        for part in (model, system_prompt, user_prompt)
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cached_chat(system_prompt: str, user_prompt: str, model: str = LLM_MODEL) -> tuple[str, bool]:
+    """
+    Chama a LLM com cache por conteudo do prompt.
+    Retorna (resposta, veio_do_cache).
+    """
+    key = _prompt_key(model, system_prompt, user_prompt)
+    with _response_cache_lock:
+        answer = _response_cache.get(key)
+        if answer is not None:
+            _response_cache.move_to_end(key)
+            return answer, True
+    
+    response = ollama.chat(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        keep_alive=KEEP_ALIVE
+    )
+    answer = response["message"]["content"]
+    
+    with _response_cache_lock:
+        _response_cache[key] = answer
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return answer, False
+
+
+def warmup_model() -> Generator[str, None, None]:
+    """
+    Carrega o modelo na memoria do Ollama antes da primeira pergunta.
+    Um prompt vazio faz o Ollama apenas carregar o modelo, sem gerar texto.
+    """
+    
+    yield f"CARREGANDO MODELO {LLM_MODEL.upper()}..."
+    
+    try:
+        ollama.generate(model=LLM_MODEL, prompt="", keep_alive=KEEP_ALIVE)
+    except Exception:
+        yield "AVISO: MODELO NAO PRE-CARREGADO"
+        return
+    
+    yield "MODELO PRONTO"
+
+
 def synthesize(question: str, context_chunks: list[str]) -> Generator[str, None, str]:
     """
     Sintetiza uma resposta usando LLM baseado nos chunks de contexto.
@@ -54,15 +121,9 @@ RESPOSTA:"""
 
     yield "CONSULTANDO LLM..."
     
-    response = ollama.chat(
-        model=LLM_MODEL,
-        messages=[
-            {"role": "system", "content": COMPLIANCE_PROMPT},
-            {"role": "user", "content": user_prompt}
-        ]
-    )
-    
-    answer = response["message"]["content"]
+    answer, cached = cached_chat(COMPLIANCE_PROMPT, user_prompt)
+    if cached:
+        yield "RESPOSTA EM CACHE"
     
     yield "RESPOSTA PRONTA"
     return answer
@@ -89,15 +150,9 @@ def format_output(text: str, skip_if_short: bool = True) -> Generator[str, None,
     
     yield "FORMATANDO RESPOSTA..."
     
-    response = ollama.chat(
-        model=LLM_MODEL,
-        messages=[
-            {"role": "system", "content": FORMAT_PROMPT},
-            {"role": "user", "content": text}
-        ]
-    )
-    
-    formatted = response["message"]["content"]
+    formatted, cached = cached_chat(FORMAT_PROMPT, text)
+    if cached:
+        yield "FORMATACAO EM CACHE"
     
     yield "FORMATACAO CONCLUIDA"
     return formatted
@@ -0,0 +1,119 @@
+"""
+Vector Utils - Infraestrutura compartilhada pelos indices FAISS
+Deteccao de GPU, cache em disco e embeddings via Ollama
+Usado por rag.py (politica) e emails_analyzer.py (emails)
+"""
+
+import os
+import hashlib
+from functools import lru_cache
+from typing import Any
+
+import faiss  # type: ignore
+import numpy as np
+import ollama
+
+from synth import KEEP_ALIVE
+
+EMBEDDING_MODEL = "mxbai-embed-large"
+
+# Versao do formato dos embeddings em cache; mudar invalida os indices salvos
+CACHE_VERSION = "embed-v2"
+
+
+# Detecta GPU
+def _detect_gpu() -> tuple[bool, int]:
+    """Detecta se GPU esta disponivel para FAISS"""
+    try:
+        num_gpus = faiss.get_num_gpus()  # type: ignore
+        return num_gpus > 0, num_gpus
+    except AttributeError:
+        # faiss-cpu nao tem get_num_gpus
+        return False, 0
+
+
+HAS_GPU, NUM_GPUS = _detect_gpu()
+
+
+@lru_cache(maxsize=1)
+def _gpu_resources() -> Any:
+    """Recursos de GPU do FAISS (memoria temporaria, streams) criados uma vez"""
+    return faiss.StandardGpuResources()  # type: ignore
+
+
+def index_to_gpu(index: Any) -> Any:
+    """Move index para GPU se disponivel"""
+    if HAS_GPU:
+        try:
+            return faiss.index_cpu_to_gpu(_gpu_resources(), 0, index)  # type: ignore
+        except Exception:
+            return index
+    return index
+
+
+def index_to_cpu(index: Any) -> Any:
+    """Move index para CPU (para salvar em disco)"""
+    if HAS_GPU:
+        try:
+            return faiss.index_gpu_to_cpu(index)  # type: ignore
+        except Exception:
+            return index
+    return index
+
+
+@lru_cache(maxsize=8)
+def _hash_file(filepath: str, mtime_ns: int, size: int) -> str:
+    """Hash MD5 do conteudo. mtime/tamanho entram na chave para invalidar o memo."""
+    with open(filepath, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def file_hash(filepath: str) -> str:
+    """Calcula hash MD5 do arquivo (memoizado por mtime/tamanho)"""
+    stat = os.stat(filepath)
+    return _hash_file(filepath, stat.st_mtime_ns, stat.st_size)
+
+
+def cache_signature(source_file: str) -> str:
+    """Assinatura gravada no .hash: conteudo da fonte + versao dos embeddings"""
+    return f"{file_hash(source_file)}:{CACHE_VERSION}"
+
+
+def cache_is_valid(cache_files: tuple[str, ...], hash_file: str, source_file: str) -> bool:
+    """Verifica se os arquivos de cache existem e se o hash bate com a fonte"""
+    cache_dir = os.path.dirname(hash_file)
+
+    # Uma unica leitura do diretorio em vez de um stat por arquivo
+    try:
+        with os.scandir(cache_dir) as entries:
+            present = {entry.name for entry in entries}
+    except FileNotFoundError:
+        return False
+
+    if not all(os.path.basename(f) in present for f in cache_files):
+        return False
+
+    with open(hash_file, "r") as f:
+        cached_hash = f.read().strip()
+
+    return cached_hash == cache_signature(source_file)
+
+
+@lru_cache(maxsize=256)
+def get_embedding(text: str, max_chars: int = 1500) -> np.ndarray:
+    """
+    Gera embedding via Ollama. Trunca texto para evitar exceder contexto.
+    Memoizado por texto: a mesma consulta (ex: RAG e emails na auditoria)
+    vai ao Ollama uma unica vez. O array retornado eh somente leitura.
+    """
+    emb = get_embeddings([text], max_chars=max_chars)[0]
+    emb.setflags(write=False)
+    return emb
+
+
+def get_embeddings(texts: list[str], max_chars: int = 1500) -> np.ndarray:
+    """Gera embeddings de varios textos numa unica chamada ao Ollama"""
+    # mxbai-embed-large tem limite de ~512 tokens (~1500-2000 chars)
+    truncated = [text[:max_chars] for text in texts]
+    response = ollama.embed(model=EMBEDDING_MODEL, input=truncated, keep_alive=KEEP_ALIVE)
+    return np.array(response["embeddings"], dtype=np.float32)